@@ -1,43 +1,123 @@
+from functools import lru_cache
+
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
 import folium
-from streamlit_folium import st_folium
+import streamlit.components.v1 as components
 from folium.plugins import MarkerCluster, HeatMap
+from folium.template import Template
 import plotly.express as px
 
 # Helper Function: Convert Roman Numerals to Integers
+ROMAN_VALUES = {'I': 1, 'V': 5, 'X': 10, 'L': 50, 'C': 100, 'D': 500, 'M': 1000}
+
+@lru_cache(maxsize=None)
 def roman_to_int(roman):
-    roman_dict = {'I': 1, 'V': 5, 'X': 10, 'L': 50, 'C': 100, 'D': 500, 'M': 1000}
-    total = 0
-    prev_value = 0
-    for char in reversed(roman):
-        value = roman_dict[char]
-        if value < prev_value:
-            total -= value
-        else:
-            total += value
-        prev_value = value
-    return total
+    # A numeral is subtracted when a larger one follows it (e.g. the I in IX)
+    values = [ROMAN_VALUES[char] for char in roman]
+    return sum(-v if v < next_v else v for v, next_v in zip(values, values[1:] + [0]))
 
 # ------------------------
 # Load and Preprocess Data
 # ------------------------
 data_file = "updated_dodge_data_with_coordinates.xlsx"  # Assume file is in the same directory
-data = pd.read_excel(data_file)
 
-# Extract totals row (if present)
-totals = data[data["Location"].str.contains("total", case=False, na=False)].iloc[0]
+@st.cache_data
+def load_data(path):
+    data = pd.read_excel(path)
+
+    # Extract totals row (if present)
+    totals = data[data["Location"].str.contains("total", case=False, na=False)].iloc[0].copy()
+
+    # Drop rows without coordinates and format Location as Camel Case
+    data = data.dropna(subset=["Latitude", "Longitude"])
+    data["Location"] = data["Location"].str.title().astype("category")
+
+    # Extract unique generation names (e.g., "IX" from "Gen IX Born")
+    generations = sorted(
+        {col.split(" ", 2)[1] for col in data.columns if col.startswith("Gen ")},
+        key=roman_to_int,
+        reverse=True
+    )
+
+    # Counts are whole numbers, so fill gaps once here and hold them as int32 rather than
+    # NaN-padded float64; nothing downstream needs to call fillna
+    gen_cols = [col for col in data.columns if col.startswith("Gen ")]
+    data[gen_cols] = data[gen_cols].fillna(0).astype("int32")
+
+    # Precompute each generation's slice (locations with at least one birth or death)
+    slices = {}
+    for gen in generations:
+        birth_col = f"Gen {gen} Born"
+        death_col = f"Gen {gen} Died"
+        slices[gen] = (
+            data.loc[(data[birth_col] > 0) | (data[death_col] > 0),
+                     ["Location", "Latitude", "Longitude", birth_col, death_col]]
+            .rename(columns={birth_col: "Births", death_col: "Deaths"})
+        )
+    return data, totals, generations, slices
+
+data, totals, generations, slices = load_data(data_file)
 
-# Drop rows without coordinates and format Location as Camel Case
-data = data.dropna(subset=["Latitude", "Longitude"])
-data["Location"] = data["Location"].str.title()
+# ------------------------
+# Map Construction
+# ------------------------
+# Marker cluster whose markers and popups are created by a single loop in the browser,
+# so Python only serializes one [lat, lon, location, count] array per layer
+class BrowserMarkerCluster(MarkerCluster):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.markerClusterGroup({{ this.options|tojavascript }});
+            {{ this.data|tojson }}.forEach(function (row) {
+                var icon = L.AwesomeMarkers.icon({icon: "info-sign", prefix: "glyphicon", markerColor: {{ this.color|tojson }}});
+                L.marker([row[0], row[1]], {icon: icon})
+                    .bindPopup("Location: " + row[2] + "<br>" + {{ this.label|tojson }} + ": " + row[3])
+                    .addTo({{ this.get_name() }});
+            });
+        {% endmacro %}
+    """)
+
+    def __init__(self, data, color, label, name=None):
+        super().__init__(name=name)
+        self._name = "BrowserMarkerCluster"
+        self.data = data
+        self.color = color
+        self.label = label
+
+# Folium output is self-contained HTML, so after the first render of a given generation
+# and set of layer toggles, reruns only look up the cached string
+@st.cache_data
+def map_html(generation, layers):
+    show_birth_markers, show_death_markers, show_birth_heatmap, show_death_heatmap = layers
+    filtered_data = slices[generation]
+    m = folium.Map(location=[filtered_data["Latitude"].mean(), filtered_data["Longitude"].mean()], zoom_start=2)
+
+    # Add marker clusters if toggles are enabled; markers are created in the browser
+    marker_cols = ["Latitude", "Longitude", "Location"]
+    if show_birth_markers:
+        birth_points = filtered_data.loc[filtered_data["Births"] > 0, marker_cols + ["Births"]]
+        BrowserMarkerCluster(birth_points.to_numpy().tolist(), "green", "Births", name="Births").add_to(m)
+    if show_death_markers:
+        death_points = filtered_data.loc[filtered_data["Deaths"] > 0, marker_cols + ["Deaths"]]
+        BrowserMarkerCluster(death_points.to_numpy().tolist(), "red", "Deaths", name="Deaths").add_to(m)
 
-# Extract unique generation names (e.g., "IX" from "Gen IX Born")
-generations = sorted(
-    list({col.split()[1] for col in data.columns if "Gen" in col}),
-    key=roman_to_int,
-    reverse=True
-)
+    # Add heatmaps if toggled, one [lat, lon, count] point per location; Leaflet.heat sums
+    # intensities per cell, so weighting by count matches repeating each point count times
+    heat_cols = ["Latitude", "Longitude"]
+    if show_birth_heatmap:
+        heat_data_births = filtered_data.loc[filtered_data["Births"] > 0, heat_cols + ["Births"]]
+        HeatMap(heat_data_births.to_numpy().tolist(), name="Births Heatmap", radius=15, 
+                gradient={0.4: "blue", 0.6: "lime", 1.0: "green"}).add_to(m)
+    if show_death_heatmap:
+        heat_data_deaths = filtered_data.loc[filtered_data["Deaths"] > 0, heat_cols + ["Deaths"]]
+        HeatMap(heat_data_deaths.to_numpy().tolist(), name="Deaths Heatmap", radius=15, 
+                gradient={0.4: "orange", 0.6: "red", 1.0: "darkred"}).add_to(m)
+
+    # Add layer control to allow toggling different layers
+    folium.LayerControl().add_to(m)
+
+    return m.get_root().render()
 
 # ------------------------
 # Main Dashboard Interface
@@ -52,177 +132,201 @@ with st.sidebar.expander("View Options"):
     show_birth_heatmap = st.checkbox("Show Births Heatmap", value=False)
     show_death_heatmap = st.checkbox("Show Deaths Heatmap", value=False)
 
-# Identify corresponding columns for births and deaths for selected generation
-birth_col = f"Gen {selected_generation} Born"
-death_col = f"Gen {selected_generation} Died"
+# Look up the precomputed slice for the selected generation
+filtered_data = slices[selected_generation]
 
-# Filter data for the selected generation (locations with at least one birth or death)
-filtered_data = data[[birth_col, death_col, "Location", "Latitude", "Longitude"]].copy()
-filtered_data = filtered_data[(filtered_data[birth_col] > 0) | (filtered_data[death_col] > 0)]
+# Shared input for the bar, donut and bubble charts and the details table
+chart_data = filtered_data[["Location", "Births", "Deaths"]]
 
 # ------------------------
 # Interactive Map Section
 # ------------------------
 st.header(f"Migration Map for Gen {selected_generation}")
 map_expanded = st.checkbox("Expand Map", value=False)
-m = folium.Map(location=[filtered_data["Latitude"].mean(), filtered_data["Longitude"].mean()], zoom_start=2)
-
-# Add marker clusters if toggles are enabled
-if show_birth_markers:
-    birth_cluster = MarkerCluster(name="Births").add_to(m)
-if show_death_markers:
-    death_cluster = MarkerCluster(name="Deaths").add_to(m)
-
-# Add markers to clusters based on births and deaths counts
-for _, row in filtered_data.iterrows():
-    if show_birth_markers and row[birth_col] > 0:
-        folium.Marker(
-            location=[row["Latitude"], row["Longitude"]],
-            popup=f"Location: {row['Location']}<br>Births: {row[birth_col]}",
-            icon=folium.Icon(color="green", icon="info-sign"),
-        ).add_to(birth_cluster)
-    if show_death_markers and row[death_col] > 0:
-        folium.Marker(
-            location=[row["Latitude"], row["Longitude"]],
-            popup=f"Location: {row['Location']}<br>Deaths: {row[death_col]}",
-            icon=folium.Icon(color="red", icon="info-sign"),
-        ).add_to(death_cluster)
-
-# Add heatmaps if toggled
-if show_birth_heatmap:
-    heat_data_births = [
-        [row["Latitude"], row["Longitude"]]
-        for _, row in filtered_data.fillna(0).iterrows()
-        for _ in range(int(row[birth_col]))
-    ]
-    HeatMap(heat_data_births, name="Births Heatmap", radius=15, 
-            gradient={0.4: "blue", 0.6: "lime", 1.0: "green"}).add_to(m)
-if show_death_heatmap:
-    heat_data_deaths = [
-        [row["Latitude"], row["Longitude"]]
-        for _, row in filtered_data.fillna(0).iterrows()
-        for _ in range(int(row[death_col]))
-    ]
-    HeatMap(heat_data_deaths, name="Deaths Heatmap", radius=15, 
-            gradient={0.4: "orange", 0.6: "red", 1.0: "darkred"}).add_to(m)
-
-# Add layer control to allow toggling different layers
-folium.LayerControl().add_to(m)
+layers = (show_birth_markers, show_death_markers, show_birth_heatmap, show_death_heatmap)
 
 # Display map according to expansion toggle
 if map_expanded:
-    st_folium(m, width=None, height=700)  # Full-screen view
+    components.html(map_html(selected_generation, layers), height=700)             # Full-screen view
 else:
-    st_folium(m, width=700, height=400)   # Default view
-
-# ------------------------
-# Bar Chart Section
-# ------------------------
-st.header(f"Births and Deaths by Location for Gen {selected_generation}")
-chart_data = filtered_data[["Location", birth_col, death_col]].copy()
-chart_data.columns = ["Location", "Births", "Deaths"]
-
-fig_bar = px.bar(
-    chart_data.melt(id_vars="Location", var_name="Type", value_name="Count"),
-    x="Location",
-    y="Count",
-    color="Type",
-    title=f"Births and Deaths by Location for Gen {selected_generation}",
-    labels={"Location": "Location", "Count": "Count", "Type": "Type"},
-)
-st.plotly_chart(fig_bar)
+    components.html(map_html(selected_generation, layers), width=700, height=400)  # Default view
 
 # ------------------------
 # Details Table Section
 # ------------------------
 st.header("Details for Selected Generation")
-chart_data_cleaned = chart_data.copy()
-chart_data_cleaned[["Births", "Deaths"]] = chart_data_cleaned[["Births", "Deaths"]].fillna(0).round(0).astype(int)
-totals_row = pd.DataFrame({
-    "Location": ["Total"],
-    "Births": [chart_data_cleaned["Births"].sum()],
-    "Deaths": [chart_data_cleaned["Deaths"].sum()]
-})
-chart_data_cleaned = pd.concat([chart_data_cleaned, totals_row], ignore_index=True)
-st.dataframe(chart_data_cleaned, height=300)
+
+# Cache the table in Arrow form, which is what st.dataframe serializes to anyway
+@st.cache_data
+def details_table(generation, _chart_data):
+    # _chart_data is left out of the cache key since it is determined by the generation
+    details = _chart_data.astype({"Location": str}).reset_index(drop=True)
+    details.loc[len(details)] = ["Total", details["Births"].sum(), details["Deaths"].sum()]
+    return pa.Table.from_pandas(details, preserve_index=False)
+
+st.dataframe(details_table(selected_generation, chart_data), height=300)
 
 # ------------------------
-# Interactive Timeline Tile
+# Charts & Graphs
 # ------------------------
-st.header("Interactive Timeline of Births by Location")
+# Figure builders are only called for the chart being shown; where practical, Plotly
+# figures are built as plain dicts to skip the Plotly Express pipeline
+def timeline_long_form():
+    # Convert wide-form data to long-form for the timeline and sunburst charts
+    id_cols = ["Location", "Latitude", "Longitude"]
+    timeline_source = data[~data["Location"].str.contains("Total", na=False)]  # Skip totals row if present
+    born = timeline_source.melt(id_vars=id_cols, value_vars=[f"Gen {gen} Born" for gen in generations],
+                                var_name="Generation", value_name="Births")
+    died = timeline_source.melt(id_vars=id_cols, value_vars=[f"Gen {gen} Died" for gen in generations],
+                                value_name="Deaths")
+    born["Generation"] = born["Generation"].str.split().str[1]
+    # Both melts walk the generations in the same order, so their rows line up one-to-one
+    timeline_df = born.assign(Deaths=died["Deaths"].to_numpy())
+    return timeline_df
+
+# Bar Chart: Births and deaths by location for selected generation
+def bar_chart():
+    locations = chart_data["Location"].tolist()
+    fig_bar = {
+        "data": [
+            {"type": "bar", "x": locations, "y": chart_data["Births"].tolist(), "name": "Births"},
+            {"type": "bar", "x": locations, "y": chart_data["Deaths"].tolist(), "name": "Deaths"},
+        ],
+        "layout": {
+            "barmode": "relative",
+            "title": {"text": f"Births and Deaths by Location for Gen {selected_generation}"},
+            "xaxis": {"title": {"text": "Location"}},
+            "yaxis": {"title": {"text": "Count"}},
+            "legend": {"title": {"text": "Type"}},
+        },
+    }
+    return fig_bar
 
-# Convert wide-form data to long-form for timeline animation
-timeline_data = []
-for idx, row in data.iterrows():
-    if "Total" in str(row["Location"]):
-        continue  # Skip totals row if present
+# Interactive Timeline: Births by location, animated across generations
+def timeline_chart():
+    timeline_df = timeline_long_form()
+
+    # Animation frames are hand-built dicts, one scattergeo trace per generation
+    size_ref = max(timeline_df["Births"].max(), 1) / (20 ** 2)  # Equivalent of px size_max=20
+    timeline_frames = [
+        {
+            "name": gen,
+            "data": [{
+                "type": "scattergeo",
+                "lat": gen_df["Latitude"].tolist(),
+                "lon": gen_df["Longitude"].tolist(),
+                "text": gen_df["Location"].tolist(),
+                "hovertemplate": "<b>%{text}</b><br>Births: %{marker.size}<extra></extra>",
+                "marker": {"size": gen_df["Births"].tolist(), "sizemode": "area", "sizeref": size_ref},
+            }],
+        }
+        for gen, gen_df in timeline_df.groupby("Generation", sort=False)
+    ]
+    # Geo traces cannot be tweened, so every frame redraws without a transition
+    frame_args = {"frame": {"duration": 500, "redraw": True}, "transition": {"duration": 0}, "mode": "immediate"}
+    fig_timeline = {
+        "data": timeline_frames[0]["data"],
+        "frames": timeline_frames,
+        "layout": {
+            "title": {"text": "Timeline: Births by Location Across Generations"},
+            "geo": {"projection": {"type": "natural earth"}},
+            "updatemenus": [{
+                "type": "buttons",
+                "direction": "left",
+                "x": 0.1,
+                "y": 0,
+                "xanchor": "right",
+                "yanchor": "top",
+                "pad": {"r": 10, "t": 70},
+                "buttons": [
+                    {"label": "&#9654;", "method": "animate", "args": [None, {**frame_args, "fromcurrent": True}]},
+                    {"label": "&#9724;", "method": "animate", "args": [[None], frame_args]},
+                ],
+            }],
+            "sliders": [{
+                "x": 0.1,
+                "y": 0,
+                "len": 0.9,
+                "pad": {"b": 10, "t": 60},
+                "currentvalue": {"prefix": "Generation="},
+                "steps": [
+                    {"label": frame["name"], "method": "animate", "args": [[frame["name"]], frame_args]}
+                    for frame in timeline_frames
+                ],
+            }],
+        },
+    }
+    return fig_timeline
+
+# Time Series Line Chart: Using totals row to show births and deaths across generations
+def trend_chart():
+    time_series_data = []
     for gen in generations:
-        birth_val = row.get(f"Gen {gen} Born", 0)
-        death_val = row.get(f"Gen {gen} Died", 0)
-        timeline_data.append({
-            "Location": row["Location"],
-            "Latitude": row["Latitude"],
-            "Longitude": row["Longitude"],
-            "Generation": gen,
-            "Births": birth_val,
-            "Deaths": death_val,
-        })
-
-timeline_df = pd.DataFrame(timeline_data)
-timeline_df["Births"] = timeline_df["Births"].fillna(0)
-
-fig_timeline = px.scatter_geo(
-    timeline_df,
-    lat="Latitude",
-    lon="Longitude",
-    size="Births",
-    hover_name="Location",
-    animation_frame="Generation",
-    title="Timeline: Births by Location Across Generations",
-    projection="natural earth",
-    size_max=20
-)
-st.plotly_chart(fig_timeline, use_container_width=True)
+        b_val = totals.get(f"Gen {gen} Born", 0)
+        d_val = totals.get(f"Gen {gen} Died", 0)
+        time_series_data.append({"Generation": gen, "Births": b_val, "Deaths": d_val})
+    time_series_df = pd.DataFrame(time_series_data)
+    # For clarity, you might want to sort generations chronologically (oldest to youngest)
+    # Here we assume our 'generations' list is in the desired order.
+    fig_line = {
+        "data": [
+            {"type": "scatter", "mode": "lines+markers", "x": time_series_df["Generation"].tolist(),
+             "y": time_series_df[col].tolist(), "name": col}
+            for col in ["Births", "Deaths"]
+        ],
+        "layout": {
+            "title": {"text": "Births and Deaths Across Generations"},
+            "xaxis": {"title": {"text": "Generation"}},
+            "yaxis": {"title": {"text": "Count"}},
+        },
+    }
+    return fig_line
 
-# ------------------------
-# Additional Charts & Graphs
-# ------------------------
-st.header("Additional Charts and Graphs")
-
-# 1. Time Series Line Chart: Using totals row to show births and deaths across generations
-time_series_data = []
-for gen in generations:
-    b_val = totals.get(f"Gen {gen} Born", 0)
-    d_val = totals.get(f"Gen {gen} Died", 0)
-    time_series_data.append({"Generation": gen, "Births": b_val, "Deaths": d_val})
-time_series_df = pd.DataFrame(time_series_data)
-# For clarity, you might want to sort generations chronologically (oldest to youngest)
-# Here we assume our 'generations' list is in the desired order.
-fig_line = px.line(time_series_df, x="Generation", y=["Births", "Deaths"], markers=True,
-                   title="Births and Deaths Across Generations")
-st.plotly_chart(fig_line, use_container_width=True)
-
-# 3. Donut Chart: Distribution of Births by Location for selected generation
-fig_donut = px.pie(chart_data, names="Location", values="Births",
-                   title=f"Distribution of Births by Location for Gen {selected_generation}",
-                   hole=0.4)
-st.plotly_chart(fig_donut, use_container_width=True)
-
-# 4. Sunburst Chart: Hierarchical view of births by Generation and Location
-fig_sunburst = px.sunburst(timeline_df, path=['Generation', 'Location'], values='Births',
-                           title="Births by Generation and Location")
-st.plotly_chart(fig_sunburst, use_container_width=True)
-
-# 5. Bubble Chart: Comparing Births vs. Deaths for selected generation
-bubble_chart_data = chart_data.copy()
-bubble_chart_data[["Births", "Deaths"]] = bubble_chart_data[["Births", "Deaths"]].fillna(0)
-fig_bubble = px.scatter(
-    bubble_chart_data,
-    x="Births",
-    y="Deaths",
-    size="Births",
-    color="Deaths",
-    hover_name="Location",
-    title=f"Births vs Deaths for Gen {selected_generation}"
-)
-st.plotly_chart(fig_bubble, use_container_width=True)
+# Donut Chart: Distribution of Births by Location for selected generation
+def donut_chart():
+    fig_donut = {
+        "data": [
+            {"type": "pie", "labels": chart_data["Location"].tolist(), "values": chart_data["Births"].tolist(), "hole": 0.4},
+        ],
+        "layout": {"title": {"text": f"Distribution of Births by Location for Gen {selected_generation}"}},
+    }
+    return fig_donut
+
+# Sunburst Chart: Hierarchical view of births by Generation and Location
+def sunburst_chart():
+    # Plain string Location avoids pandas' observed=False warning when px groups on a category
+    timeline_df = timeline_long_form().astype({"Location": str})
+    fig_sunburst = px.sunburst(timeline_df, path=['Generation', 'Location'], values='Births',
+                               title="Births by Generation and Location")
+    return fig_sunburst
+
+# Bubble Chart: Comparing Births vs. Deaths for selected generation
+def bubble_chart():
+    fig_bubble = px.scatter(
+        chart_data,
+        x="Births",
+        y="Deaths",
+        size="Births",
+        color="Deaths",
+        hover_name="Location",
+        title=f"Births vs Deaths for Gen {selected_generation}"
+    )
+    return fig_bubble
+
+charts = {
+    "Bar": bar_chart,
+    "Timeline": timeline_chart,
+    "Trend": trend_chart,
+    "Donut": donut_chart,
+    "Sunburst": sunburst_chart,
+    "Bubble": bubble_chart,
+}
+
+# Only the selected chart is built, and switching charts reruns just this fragment
+@st.fragment
+def show_chart():
+    selected_chart = st.radio("Chart", list(charts), horizontal=True)
+    st.plotly_chart(charts[selected_chart](), use_container_width=True)
+
+st.header("Charts and Graphs")
+show_chart()